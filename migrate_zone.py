@@ -5,17 +5,24 @@ Migrate zones from dynect to OCI
 '''
 
 import argparse
+import concurrent.futures
+import functools
 import getpass
+import itertools
+import json
+import logging
+import random
 import socket
+import threading
 import time
-import traceback
 import urllib.parse
 import urllib.request
 
+import orjson
 import requests
 import oci
-import dns.zone
 import dns.query
+import dns.rdatatype
 import dns.xfr
 
 from dyn.tm.session import DynectSession
@@ -23,10 +30,24 @@ from dyn.tm.zones import Zone
 from dyn.tm.zones import SecondaryZone
 from dyn.tm.zones import TSIG
 from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from oci.signer import Signer
 
 
-MAX_POLL_ATTEMPTS = 100
+XFROUT_HOSTNAME = 'xfrout1.dynect.net'
+
+LIST_PAGE_LIMIT = 100
+
+POLL_TIMEOUT_SECONDS = 500
+POLL_INITIAL_DELAY_SECONDS = 0.25
+POLL_MAX_DELAY_SECONDS = 5
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1, got {value}')
+    return number
 
 
 parser = argparse.ArgumentParser(
@@ -104,10 +125,22 @@ parser.add_argument(
 )
 parser.set_defaults(ignore_failures=True)
 
+parser.add_argument(
+    '--concurrency',
+    type=positive_int,
+    default=16,
+    help='The number of zones to migrate at the same time. Workers spend most of their time ' \
+         'waiting on Dynect and OCI, so this can be set well above the number of CPUs.'
+)
+
 
 args = parser.parse_args()
 
 
+logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+
 dynect_password = args.dynect_password
 if dynect_password == "":
     dynect_password = getpass.getpass(prompt='Dynect password: ')
@@ -126,15 +159,25 @@ if https_proxy is not None:
     PROXY_USER = parsed.username
     PROXY_PASS = parsed.password
 
-dynect_session = DynectSession(
-    args.dynect_customer,
-    args.dynect_username,
-    dynect_password,
-    proxy_host=PROXY_HOST,
-    proxy_port=PROXY_PORT,
-    proxy_user=PROXY_USER,
-    proxy_pass=PROXY_PASS,
-)
+# The dyn library keeps a separate session for each thread, so every thread
+# that talks to Dynect must open its own session
+dynect_thread_state = threading.local()
+
+
+def ensure_dynect_session():
+    if getattr(dynect_thread_state, 'session', None) is None:
+        dynect_thread_state.session = DynectSession(
+            args.dynect_customer,
+            args.dynect_username,
+            dynect_password,
+            proxy_host=PROXY_HOST,
+            proxy_port=PROXY_PORT,
+            proxy_user=PROXY_USER,
+            proxy_pass=PROXY_PASS,
+        )
+
+
+ensure_dynect_session()
 
 
 config = oci.config.from_file(args.oci_config_file, args.oci_config_profile)
@@ -146,8 +189,26 @@ OCI_DNS_ZONES_BASE_URL = f'{OCI_DNS_BASE_URL}/zones'
 OCI_DNS_TSIG_KEYS_BASE_URL = f'{OCI_DNS_BASE_URL}/tsigKeys'
 
 
+# Size the connection pool so that each worker thread can hold a connection to OCI,
+# and retry requests that fail because OCI is throttling or briefly unavailable.
+# OCI DNS creates don't take a retry token, but zone and tsig key names are
+# unique, so a retried POST can't create a resource twice. A retry that
+# conflicts with what an earlier attempt created is handled where the create
+# is sent.
 session = requests.session()
-session.mount('http://', HTTPAdapter(max_retries=0))
+adapter = HTTPAdapter(
+    pool_connections=args.concurrency,
+    pool_maxsize=args.concurrency,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {'POST'},
+        raise_on_status=False,
+    ),
+)
+session.mount('http://', adapter)
+session.mount('https://', adapter)
 
 auth = Signer(
     tenancy=config['tenancy'],
@@ -155,12 +216,17 @@ auth = Signer(
     fingerprint=config['fingerprint'],
     private_key_file_location=config['key_file'],
 )
-opcprincipal = f'{{"tenantId": "{config["tenancy"]}", "subjectId": "{config["user"]}"}}'
+opcprincipal = json.dumps({
+    'tenantId': config['tenancy'],
+    'subjectId': config['user'],
+})
 
 headers = {
     'opc-principal': opcprincipal,
     'Accept': 'application/json',
 }
+JSON_HEADERS = {**headers, 'Content-Type': 'application/json'}
+DNS_HEADERS = {**headers, 'Content-Type': 'text/dns'}
 
 
 compartment = args.oci_compartment
@@ -171,69 +237,97 @@ tsig_key_compartment = args.tsig_key_compartment
 if tsig_key_compartment == '':
     tsig_key_compartment = compartment
 
+# Many secondary zones usually share a few tsig keys, so remember the OCID of
+# every tsig key that has been looked up or created. Keys that are currently
+# being looked up or created by one worker are tracked with an event that
+# other workers wait on instead of creating the same key again.
+tsig_key_ocids = {}
+tsig_key_events = {}
+tsig_key_lock = threading.Lock()
 
-def poll_tsig_key_create(tsig_key_ocid):
-    poll_attempts = 0
-
-    while poll_attempts < MAX_POLL_ATTEMPTS:
-        poll_attempts += 1
-
-        response = session.get(
-            f'{OCI_DNS_TSIG_KEYS_BASE_URL}/{tsig_key_ocid}',
-            auth=auth,
-            headers=headers,
-        )
+# Dynect lookups made while finding tsig keys, kept so that they aren't made
+# again when the zones are migrated. Secondary zones that use a tsig key are
+# kept whole; for every other zone only its type is kept.
+dynect_secondary_zones = {}
+dynect_zone_types = {}
 
-        if response.status_code != requests.codes.ok:
-            raise Exception(
-                f'Failed to get lifecycle state for tsig key "{tsig_key_ocid}" (opc-request-id: '
-                f'"{response.headers.get("opc-request-id")}"): {response.json()}'
-            )
 
-        if response.json()['lifecycleState'] == 'CREATING':
-            time.sleep(5)
-        elif response.json()['lifecycleState'] == 'ACTIVE':
-            return
-        else:
-            raise Exception(
-                f'Unexpected status for tsig key "{tsig_key_ocid}" (opc-request-id: '
-                f'"{response.headers.get("opc-request-id")}"): {response.json()}'
-            )
+def poll_create(url, resource_label, initial_body=None, initial_etag=None):
+    # The response to the create request already describes the resource, and
+    # small resources can be active as soon as they are created
+    if initial_body is not None and initial_body['lifecycleState'] == 'ACTIVE':
+        return
 
-    raise Exception(f'Timed out waiting for tsig key "{tsig_key_ocid}" to finish being created')
+    poll_attempts = 0
+    request_headers = headers
+    if initial_etag is not None:
+        request_headers = {'If-None-Match': initial_etag, **headers}
+    deadline = time.monotonic() + POLL_TIMEOUT_SECONDS
+
+    while time.monotonic() < deadline:
+        response = session.get(url, auth=auth, headers=request_headers)
+
+        # A 304 means nothing has changed since the previous poll, so the
+        # resource is still being created
+        if response.status_code != requests.codes.not_modified:
+            if response.status_code != requests.codes.ok:
+                raise Exception(
+                    f'Failed to get lifecycle state for {resource_label} (opc-request-id: '
+                    f'"{response.headers.get("opc-request-id")}"): {response.json()}'
+                )
 
+            body = response.json()
+            if body['lifecycleState'] == 'ACTIVE':
+                return
+            if body['lifecycleState'] != 'CREATING':
+                raise Exception(
+                    f'Unexpected status for {resource_label} (opc-request-id: '
+                    f'"{response.headers.get("opc-request-id")}"): {body}'
+                )
 
-def poll_zone_create(zone_ocid):
-    poll_attempts = 0
+            etag = response.headers.get('etag')
+            if etag is not None:
+                request_headers = {'If-None-Match': etag, **headers}
 
-    while poll_attempts < MAX_POLL_ATTEMPTS:
+        # Back off exponentially with some jitter so that resources which are
+        # created quickly are picked up quickly
+        delay = min(POLL_MAX_DELAY_SECONDS, POLL_INITIAL_DELAY_SECONDS * 2 ** poll_attempts)
         poll_attempts += 1
+        time.sleep(delay * random.uniform(0.8, 1.2))
 
-        response = session.get(
-            f'{OCI_DNS_ZONES_BASE_URL}/{zone_ocid}',
-            auth=auth,
-            headers=headers,
-        )
+    raise Exception(f'Timed out waiting for {resource_label} to finish being created')
 
-        if response.status_code != requests.codes.ok:
-            raise Exception(
-                f'Failed to get lifecycle state for zone "{zone_ocid}" (opc-request-id: ' \
-                f'"{response.headers.get("opc-request-id")}"): {response.json()}')
-
-        if response.json()['lifecycleState'] == 'CREATING':
-            time.sleep(5)
-        elif response.json()['lifecycleState'] == 'ACTIVE':
-            return
-        else:
-            raise Exception(
-                f'Unexpected status for zone "{zone_ocid}" (opc-request-id: '
-                f'"{response.headers.get("opc-request-id")}"): {response.json()}'
-            )
 
-    raise Exception(f'Timed out waiting for zone "{zone_ocid}" to finish being created')
+def get_or_create_tsig_key(tsig_key_name):
+    while True:
+        with tsig_key_lock:
+            if tsig_key_name in tsig_key_ocids:
+                return tsig_key_ocids[tsig_key_name]
+
+            event = tsig_key_events.get(tsig_key_name)
+            is_owner = event is None
+            if is_owner:
+                event = threading.Event()
+                tsig_key_events[tsig_key_name] = event
+
+        if not is_owner:
+            # If the other worker fails, the key won't be cached and this
+            # worker will try to get or create it itself
+            event.wait()
+            continue
+
+        try:
+            tsig_key_ocid = lookup_or_create_tsig_key(tsig_key_name)
+            with tsig_key_lock:
+                tsig_key_ocids[tsig_key_name] = tsig_key_ocid
+            return tsig_key_ocid
+        finally:
+            with tsig_key_lock:
+                del tsig_key_events[tsig_key_name]
+            event.set()
 
 
-def get_or_create_tsig_key(tsig_key_name):
+def find_tsig_key(tsig_key_name):
     # Fetch tsig keys in the tsig key compartment with a name matching the
     # dynect secondary zone's tsig key name
     response = session.get(
@@ -243,27 +337,34 @@ def get_or_create_tsig_key(tsig_key_name):
         params={
             'compartmentId': tsig_key_compartment,
             'name': tsig_key_name,
+            'limit': 1,
         }
     )
 
-    if response.status_code == requests.codes.ok:
-        if len(response.json()) > 0:
-            tsig_key = response.json()[0]
-
-            # Verify the tsig key is active
-            if tsig_key['lifecycleState'] != 'ACTIVE':
-                raise Exception(
-                    f'The OCI tsig key with the name "{tsig_key_name}" was in the '
-                    f'"{tsig_key["lifecycleState"]}" state, but must be in the "ACTIVE" state'
-                )
-
-            return tsig_key['id']
-    else:
+    if response.status_code != requests.codes.ok:
         raise Exception(
             f'Failed to look up tsig keys in OCI (opc-request-id: '
             f'"{response.headers.get("opc-request-id")}")'
         )
 
+    tsig_keys = response.json()
+    if len(tsig_keys) > 0:
+        return tsig_keys[0]
+    return None
+
+
+def lookup_or_create_tsig_key(tsig_key_name):
+    tsig_key = find_tsig_key(tsig_key_name)
+    if tsig_key is not None:
+        # Verify the tsig key is active
+        if tsig_key['lifecycleState'] != 'ACTIVE':
+            raise Exception(
+                f'The OCI tsig key with the name "{tsig_key_name}" was in the '
+                f'"{tsig_key["lifecycleState"]}" state, but must be in the "ACTIVE" state'
+            )
+
+        return tsig_key['id']
+
     # Attempt to fetch the tsig key's details from dynect and create the tsig key in OCI.
     try:
         dynect_tsig_key = TSIG(tsig_key_name)
@@ -282,27 +383,43 @@ def get_or_create_tsig_key(tsig_key_name):
     response = session.post(
         OCI_DNS_TSIG_KEYS_BASE_URL,
         auth=auth,
-        headers={
-            'Content-Type': 'application/json',
-            **headers
-        },
-        json=tsig_key_data,
+        headers=JSON_HEADERS,
+        data=orjson.dumps(tsig_key_data),
     )
 
-    if response.status_code != requests.codes.created:
+    body = response.json()
+    initial_body = body
+    initial_etag = response.headers.get('etag')
+
+    tsig_key_ocid = None
+    if response.status_code == requests.codes.created:
+        tsig_key_ocid = body['id']
+    elif response.status_code == requests.codes.conflict:
+        # The create may have been retried after an attempt that did create the
+        # key, so carry on with the key if there is one
+        tsig_key = find_tsig_key(tsig_key_name)
+        if tsig_key is not None:
+            tsig_key_ocid = tsig_key['id']
+            initial_body = tsig_key
+            initial_etag = None
+
+    if tsig_key_ocid is None:
         raise Exception(
             f'Failed to create tsig key with name "{tsig_key_name}" (opc-request-id: '
-            f'"{response.headers.get("opc-request-id")}"): {response.json()}'
+            f'"{response.headers.get("opc-request-id")}"): {body}'
         )
 
-    tsig_key_ocid = response.json()['id']
-
     print(
         f'Creating tsig key "{tsig_key_name}" in OCI DNS. Tsig key OCID: "{tsig_key_ocid}". '
         f'Waiting for tsig key creation to complete.'
     )
     try:
-        poll_tsig_key_create(tsig_key_ocid)
+        poll_create(
+            f'{OCI_DNS_TSIG_KEYS_BASE_URL}/{tsig_key_ocid}',
+            f'tsig key "{tsig_key_ocid}"',
+            initial_body=initial_body,
+            initial_etag=initial_etag,
+        )
     except Exception as ex:
         raise Exception(
             f'Encountered a problem while waiting for creation of tsig key "{tsig_key_name}" '
@@ -314,8 +431,93 @@ def get_or_create_tsig_key(tsig_key_name):
     return tsig_key_ocid
 
 
-def create_zone(zone_name):
-    # Check if there is already an OCI zone in the compartment with the provided name
+@functools.lru_cache(maxsize=1)
+def get_xfrout_addresses():
+    # The transfer server is resolved once per run. A failed lookup isn't
+    # cached, so it is retried by the next zone that needs it. Only IPv4
+    # addresses are used since transfers are allowed per public IPv4 address.
+    address_infos = socket.getaddrinfo(XFROUT_HOSTNAME, 53, socket.AF_INET, socket.SOCK_STREAM)
+    return list(dict.fromkeys(address_info[4][0] for address_info in address_infos))
+
+
+def start_xfr(zone_name):
+    # Try each of the transfer server's addresses until one can be reached,
+    # and return the messages of the zone transfer
+    addresses = get_xfrout_addresses()
+    for i, address in enumerate(addresses):
+        messages = dns.query.xfr(address, zone_name)
+        try:
+            return itertools.chain([next(messages)], messages)
+        except OSError:
+            if i == len(addresses) - 1:
+                raise
+
+
+def fetch_zonefile(zone_name, zone_name_with_dot):
+    # Transfer the zone from Dynect and format the records straight from the
+    # transfer messages, without building a dns.zone.Zone first. The zone file
+    # is returned as bytes because OCI signs a hash of the whole request body.
+    chunks = [f'$ORIGIN {zone_name_with_dot}\n'.encode()]
+
+    # A zone transfer ends by repeating the SOA record it started with
+    soa_seen = False
+    for message in start_xfr(zone_name):
+        for rrset in message.answer:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                if soa_seen:
+                    continue
+                soa_seen = True
+            chunks.append(rrset.to_text().encode() + b'\n')
+
+    return b''.join(chunks)
+
+
+def normalize_zone_name(zone_name):
+    return zone_name.rstrip('.').lower()
+
+
+def list_existing_zones():
+    # Fetch every OCI zone in the compartment, one page at a time, and return
+    # a mapping from each zone's name to its OCID. Returns None if the zones
+    # can't be listed, in which case each zone is looked up by name instead.
+    existing_zones = {}
+    params = {
+        'compartmentId': compartment,
+        'limit': LIST_PAGE_LIMIT,
+    }
+
+    while True:
+        response = session.get(
+            OCI_DNS_ZONES_BASE_URL,
+            auth=auth,
+            headers=headers,
+            params=params,
+        )
+
+        if response.status_code != requests.codes.ok:
+            logger.warning(
+                'Failed to list zones in OCI (opc-request-id: "%s"). Looking up each zone by '
+                'name instead.',
+                response.headers.get('opc-request-id'),
+            )
+            return None
+
+        for zone in response.json():
+            existing_zones[normalize_zone_name(zone['name'])] = zone['id']
+
+        next_page = response.headers.get('opc-next-page')
+        if next_page is None:
+            return existing_zones
+        params['page'] = next_page
+
+
+def find_existing_zone(zone_name, existing_zones):
+    # Returns the OCID of the OCI zone in the compartment with the provided
+    # name, or None if there isn't one. The zone is looked up by name when
+    # existing_zones is None.
+    if existing_zones is not None:
+        return existing_zones.get(normalize_zone_name(zone_name))
+
     response = session.get(
         OCI_DNS_ZONES_BASE_URL,
         auth=auth,
@@ -323,45 +525,123 @@ def create_zone(zone_name):
         params={
             'compartmentId': compartment,
             'name': zone_name,
+            'limit': 1,
         },
     )
 
     if response.status_code == requests.codes.ok:
-        if len(response.json()) > 0:
-            print(
-                f'Found existing OCI zone with name "{zone_name}". Zone OCID: '
-                f'"{response.json()[0]["id"]}. Skipping."'
-            )
-            return
+        zones = response.json()
+        if len(zones) > 0:
+            return zones[0]['id']
+
+    return None
 
+
+def lookup_dynect_zone_type(zone_name):
     try:
-        dynect_zone = Zone(zone_name)
+        return Zone(zone_name)._zone_type
     except Exception as ex:
         raise Exception(
             f'Failed to look up the zone {zone_name} from Dynect. Verify the zone exists in '
             f'Dynect and that the user has permission to look up the zone.'
         ) from ex
 
-    if dynect_zone._zone_type == 'Secondary':
+
+def lookup_dynect_secondary_zone(zone_name):
+    try:
+        return SecondaryZone(zone_name)
+    except Exception as ex:
+        raise Exception(
+            f'Failed to load the secondary zone {zone_name} from Dynect. The Dynect user may '
+            f'need the "SecondaryGet" permission in Dynect.'
+        ) from ex
+
+
+def find_tsig_key_name(zone_name, existing_zones):
+    ensure_dynect_session()
+
+    if find_existing_zone(zone_name, existing_zones) is not None:
+        return None
+
+    try:
+        zone_type = lookup_dynect_zone_type(zone_name)
+        if zone_type == 'Secondary':
+            dynect_secondary_zone = lookup_dynect_secondary_zone(zone_name)
+            if dynect_secondary_zone.tsig_key_name != '':
+                dynect_secondary_zones[zone_name] = dynect_secondary_zone
+                return dynect_secondary_zone.tsig_key_name
+    except Exception:
+        # The failure is reported when the zone itself is migrated
+        return None
+
+    dynect_zone_types[zone_name] = zone_type
+    return None
+
+
+def prepare_tsig_key(tsig_key_name):
+    ensure_dynect_session()
+
+    try:
+        get_or_create_tsig_key(tsig_key_name)
+    except Exception:
+        if not args.ignore_failures:
+            raise
+        logger.exception(
+            'Failed to get or create the tsig key %s. Moving on to the next.',
+            tsig_key_name,
+            extra={'tsig_key': tsig_key_name},
+        )
+
+
+def prepare_tsig_keys(executor, existing_zones):
+    # Find every tsig key used by the secondary zones being migrated and get or
+    # create each of them once, before any zones are created. Creating the
+    # zones then only reads tsig key OCIDs from the cache. This reads every
+    # zone name and looks up every zone in Dynect before any zone is migrated.
+    tsig_key_names = set(map_bounded(
+        executor,
+        functools.partial(find_tsig_key_name, existing_zones=existing_zones),
+        read_zone_names(),
+    ))
+    tsig_key_names.discard(None)
+
+    for _ in map_bounded(executor, prepare_tsig_key, tsig_key_names):
+        pass
+
+
+def create_zone(zone_name, existing_zones):
+    # Check if there is already an OCI zone in the compartment with the provided name
+    existing_zone_ocid = find_existing_zone(zone_name, existing_zones)
+    if existing_zone_ocid is not None:
+        print(
+            f'Found existing OCI zone with name "{zone_name}". Zone OCID: '
+            f'"{existing_zone_ocid}. Skipping."'
+        )
+        return
+
+    dynect_secondary_zone = dynect_secondary_zones.pop(zone_name, None)
+    zone_type = dynect_zone_types.pop(zone_name, None)
+    if dynect_secondary_zone is not None:
+        zone_type = 'Secondary'
+    elif zone_type is None:
+        zone_type = lookup_dynect_zone_type(zone_name)
+
+    if zone_type == 'Secondary':
         # Create a secondary zone in OCI DNS
-        # Fetch the secondary zone
-        try:
-            dynect_secondary_zone = SecondaryZone(zone_name)
-        except Exception as ex:
-            raise Exception(
-                f'Failed to load the secondary zone {zone_name} from Dynect. The Dynect user may '
-                f'need the "SecondaryGet" permission in Dynect.'
-            ) from ex
+        if dynect_secondary_zone is None:
+            dynect_secondary_zone = lookup_dynect_secondary_zone(zone_name)
 
+        masters = list(dynect_secondary_zone._masters)
+        tsig_key_name = dynect_secondary_zone.tsig_key_name
         tsig_key_ocid = None
 
         # Check if the secondary zone is configured to use a tsig key. If it is,
-        # check if a tsig key by that name has already been created in OCI. If it
-        # has not already been created, attempt to create it before creating the
+        # the key has usually been created by prepare_tsig_keys already. If that
+        # failed, make one more attempt to get or create it before creating the
         # secondary zone.
-        if dynect_secondary_zone.tsig_key_name != '':
+        if tsig_key_name != '':
             try:
-                tsig_key_ocid = get_or_create_tsig_key(dynect_secondary_zone.tsig_key_name)
+                tsig_key_ocid = get_or_create_tsig_key(tsig_key_name)
             except Exception as ex:
                 raise Exception(
                     f'Could not get or create tsig key for secondary zone {zone_name}'
@@ -375,18 +655,15 @@ def create_zone(zone_name):
                 {
                     'address': address,
                     'tsigKeyId': tsig_key_ocid,
-                } for address in dynect_secondary_zone._masters
+                } for address in masters
             ]
         }
 
         response = session.post(
             OCI_DNS_ZONES_BASE_URL,
             auth=auth,
-            headers={
-                'Content-Type': 'application/json',
-                **headers
-            },
-            json=secondary_zone_data,
+            headers=JSON_HEADERS,
+            data=orjson.dumps(secondary_zone_data),
         )
 
     else:
@@ -403,13 +680,7 @@ def create_zone(zone_name):
             zone_name_with_dot = zone_name_with_dot + "."
 
         try:
-            zonefile = dns.zone.from_xfr(
-                dns.query.xfr(
-                    socket.gethostbyname('xfrout1.dynect.net'),
-                    zone_name,
-                )
-            ).to_text()
-            zonefile = f'$ORIGIN {zone_name_with_dot}\n{zonefile}'
+            zonefile = fetch_zonefile(zone_name, zone_name_with_dot)
         except dns.xfr.TransferError:
             raise Exception(
                 f'''
@@ -437,44 +708,115 @@ Make sure that "Transfers" is selected for your IP address.
         response = session.post(
             CREATE_OCI_DNS_ZONE_FROM_ZONEFILE_URL,
             auth=auth,
-            headers={
-                'Content-Type': 'text/dns',
-                **headers
-            },
+            headers=DNS_HEADERS,
             params=params,
             data=zonefile,
         )
 
-    if response.status_code != requests.codes.created:
+    body = response.json()
+    initial_body = body
+    initial_etag = response.headers.get('etag')
+
+    zone_ocid = None
+    if response.status_code == requests.codes.created:
+        zone_ocid = body['id']
+    elif response.status_code == requests.codes.conflict:
+        # The create may have been retried after an attempt that did create the
+        # zone, so carry on with the zone if there is one
+        zone_ocid = find_existing_zone(zone_name, None)
+        initial_body = None
+        initial_etag = None
+
+    if zone_ocid is None:
         raise Exception(
             f'Failed to create zone with name "{zone_name}" (opc-request-id: '
-            f'"{response.headers.get("opc-request-id")}"): {response.json()}'
+            f'"{response.headers.get("opc-request-id")}"): {body}'
         )
 
     print(
-        f'Creating "{zone_name}" in OCI DNS. Zone OCID: {response.json()["id"]}. Waiting for '
+        f'Creating "{zone_name}" in OCI DNS. Zone OCID: {zone_ocid}. Waiting for '
         f'zone creation to complete.'
     )
 
-    poll_zone_create(response.json()["id"])
+    poll_create(
+        f'{OCI_DNS_ZONES_BASE_URL}/{zone_ocid}',
+        f'zone "{zone_ocid}"',
+        initial_body=initial_body,
+        initial_etag=initial_etag,
+    )
     print(f'Creation of zone "{zone_name}" in OCI DNS complete.')
 
 
-def migrate_zones():
+def migrate_zone(zone_name, existing_zones):
+    ensure_dynect_session()
+
+    try:
+        create_zone(zone_name, existing_zones)
+    except Exception:
+        if not args.ignore_failures:
+            raise
+        logger.exception(
+            'Failed to create the zone %s. Moving on to the next.',
+            zone_name,
+            extra={'zone': zone_name},
+        )
+
+
+def read_zone_names():
     if args.zone_name is not None:
-        zone_names = [args.zone_name]
+        yield args.zone_name
+        return
+
+    # The existing zones are only listed once, so remember the names that have
+    # been read and skip zones that are listed more than once rather than
+    # trying to create them twice
+    seen_zone_names = set()
+    with open(args.zone_names_file, 'r', encoding='UTF-8') as zone_names_file:
+        for line in zone_names_file:
+            zone_name = line.strip()
+            if zone_name == '' or normalize_zone_name(zone_name) in seen_zone_names:
+                continue
+            seen_zone_names.add(normalize_zone_name(zone_name))
+            yield zone_name
+
+
+def map_bounded(executor, function, items):
+    # Like executor.map, except that the next item is only read once a worker is
+    # free to process it, and results are yielded in the order they complete. If
+    # a call fails, calls that are already running are allowed to finish but no
+    # more are started.
+    futures = set()
+    for item in items:
+        if len(futures) >= args.concurrency:
+            done, futures = concurrent.futures.wait(
+                futures,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                yield future.result()
+
+        futures.add(executor.submit(function, item))
+
+    for future in concurrent.futures.as_completed(futures):
+        yield future.result()
+
+
+def migrate_zones():
+    # A single zone is looked up by name rather than by listing every zone in
+    # the compartment
+    existing_zones = None
     if args.zone_names_file is not None:
-        with open(args.zone_names_file, 'r', encoding='UTF-8') as zone_names_file:
-            zone_names = zone_names_file.read().splitlines()
+        existing_zones = list_existing_zones()
 
-    for zone_name in zone_names:
-        try:
-            create_zone(zone_name)
-        except Exception as ex:
-            if not args.ignore_failures:
-                raise ex
-            traceback.print_exc()
-            print(f'\nFailed to create the zone {zone_name}. Moving on to the next.\n')
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        prepare_tsig_keys(executor, existing_zones)
+
+        for _ in map_bounded(
+            executor,
+            functools.partial(migrate_zone, existing_zones=existing_zones),
+            read_zone_names(),
+        ):
+            pass
 
 
 migrate_zones()